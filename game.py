@@ -1,100 +1,231 @@
+from bisect import insort
+
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the rollout kernel runs as plain Python.
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Bitboard layout: each column takes 7 bits (6 playable rows plus one empty
+# sentinel bit on top), numbered bottom-up and column by column:
+#
+#   6 13 20 27 34 41 48   <- sentinel row, always empty
+#   5 12 19 26 33 40 47
+#   4 11 18 25 32 39 46
+#   3 10 17 24 31 38 45
+#   2  9 16 23 30 37 44
+#   1  8 15 22 29 36 43
+#   0  7 14 21 28 35 42
+#
+# The sentinel row keeps shifted lines from wrapping into the next column, so
+# four in a row can be detected with a couple of shifts and ANDs per direction.
+ROWS = 6
+COLS = 7
+H1 = ROWS + 1
+
+# Bottom square of every column, and every playable (non-sentinel) square.
+# For an occupancy bitboard 'occ', (occ + BOTTOM) carries up each column to its
+# lowest empty square; a full column carries into its sentinel bit, which
+# BOARD masks off. So (occ + BOTTOM) & BOARD is the set of legal drop squares.
+BOTTOM = sum(1 << (c * H1) for c in range(COLS))
+BOARD = BOTTOM * ((1 << ROWS) - 1)
+
+# Zobrist keys indexed by square * 2 + player, where square is the bit index
+# above. Fixed seed so hashes are reproducible between runs.
+ZOBRIST = [int(z) for z in np.random.SeedSequence(0).generate_state(COLS * H1 * 2, dtype=np.uint64)]
+
+def _has_win(bb):
+    """Return True if the single-player bitboard 'bb' holds four in a row."""
+    # Shifts: 1 = vertical, 7 = horizontal, 6 = negative slope, 8 = positive slope.
+    # bb & (bb >> s) marks pairs along a direction, and ANDing that with itself
+    # shifted by 2s leaves a bit only where four consecutive pieces line up.
+    # Written out per direction: this is called for every node and root check,
+    # and the straight-line version skips the loop and tuple iteration.
+    x = bb & (bb >> 1)
+    if x & (x >> 2):
+        return True
+    x = bb & (bb >> 7)
+    if x & (x >> 14):
+        return True
+    x = bb & (bb >> 6)
+    if x & (x >> 12):
+        return True
+    x = bb & (bb >> 8)
+    if x & (x >> 16):
+        return True
+    return False
+
+# Compiled copy for use inside the rollout kernel; Python callers use _has_win,
+# which avoids the dispatch overhead of calling into Numba for one check.
+_has_win_jit = njit(cache=True, nogil=True)(_has_win)
+
+@njit(cache=True, nogil=True)
+def rollout(bb0, bb1, heights, turn):
+    """
+    Play uniformly random moves from the given position until the game ends.
+    'heights' is an int64 array in the layout above and is not modified.
+    Returns the index of the winning player, or 2 for a draw.
+    """
+    bbs = np.empty(2, np.int64)
+    bbs[0] = bb0
+    bbs[1] = bb1
+    h = heights.copy()
+    moves = np.empty(COLS, np.int8)
+    # One batch of uniform draws covers every ply a game can still have, so
+    # there is a single RNG call per rollout rather than one per move.
+    draws = np.random.random(ROWS * COLS)
+    ply = 0
+    while True:
+        n = 0
+        for c in range(COLS):
+            if h[c] < c * H1 + ROWS:
+                moves[n] = c
+                n += 1
+        if n == 0:
+            return 2
+
+        c = moves[int(draws[ply] * n)]
+        ply += 1
+        p = turn & 1
+        bbs[p] ^= np.int64(1) << h[c]
+        h[c] += 1
+
+        if _has_win_jit(bbs[p]):
+            return p
+        turn += 1
+
+@njit(cache=True)
+def seed_rollouts(seed):
+    """Seed the RNG used by rollout() (Numba keeps its own, separate from NumPy's)."""
+    np.random.seed(seed)
+
 class Connect4:
     def __init__(self):
-        self.board = np.array([[" "] * 7 for _ in range(6)])
+        # One bitboard per player (index matches player_list) and, per column,
+        # the bit index of the next free slot.
+        self.bb = [0, 0]
+        self.heights = [c * H1 for c in range(COLS)]
+        # Zobrist hash of the position, updated incrementally by make_move.
+        self.zhash = 0
+        # Columns played so far, most recent last, so moves can be undone.
+        self.history = []
         self.game_over = False
         self.player_list = ["R", "Y"]
         self.current_turn = 0
-        self.available_moves = self._get_available_moves(self.board)
+        # Legal columns in ascending order, kept up to date by make_move/undo_move.
+        self.available_moves = list(range(COLS))
         self.sum = 0
 
+    @property
+    def board(self):
+        """
+        The position for display: a list of 6 strings of 7 "R"/"Y"/" " cells,
+        top row first, so board[r][c] is row r, column c.
+        """
+        cells = bytearray(b" " * (ROWS * COLS))
+        for p, bb in enumerate(self.bb):
+            mark = ord(self.player_list[p])
+            for c in range(COLS):
+                for r in range(ROWS):
+                    if bb >> (c * H1 + r) & 1:
+                        cells[(ROWS - 1 - r) * COLS + c] = mark
+        return [cells[r * COLS:(r + 1) * COLS].decode() for r in range(ROWS)]
+
     def copy(self):
         """Create a fast copy of the game state."""
         new_game = Connect4()
-        new_game.board = np.copy(self.board)
+        new_game.bb = list(self.bb)
+        new_game.heights = list(self.heights)
+        new_game.zhash = self.zhash
+        new_game.history = list(self.history)
         new_game.game_over = self.game_over
         new_game.current_turn = self.current_turn
         # Important: copy the list to avoid reference issues, though strings are immutable
-        new_game.player_list = list(self.player_list) 
-        # available_moves is a list of ints, a shallow copy or re-generation is fine
+        new_game.player_list = list(self.player_list)
+        # available_moves is a list of ints, a shallow copy is enough
         new_game.available_moves = list(self.available_moves)
         return new_game
 
-    def _get_available_moves(self, board=None):
-        if board is None:
-            board = self.board
-        moves = []
-        for c in range(7):
-            if board[0][c] == " ":
-                moves.append(c)
-        
+    def _get_available_moves(self):
+        # Copy the cached list so callers can modify their result freely.
+        moves = list(self.available_moves)
+
         if not moves:
             self.game_over = True
-        
+
         return moves
-    
+
     def make_move(self, move):
-        self.available_moves = self._get_available_moves()
         if move in self.available_moves:
-            board = np.transpose(self.board)
-            invcol = np.flip(board[move])
-            for n in range(len(invcol)):
-                if invcol[n] == " ":
-                    self.board[len(invcol)-n-1][move] = self.player_list[self.current_turn%2]
-                    self.current_turn += 1
-                    return True
+            player = self.current_turn & 1
+            square = self.heights[move]
+            self.bb[player] ^= 1 << square
+            self.zhash ^= ZOBRIST[square * 2 + player]
+            self.heights[move] += 1
+            # A column only leaves the list when this move fills it.
+            if square == move * H1 + ROWS - 1:
+                self.available_moves.remove(move)
+                if not self.available_moves:
+                    self.game_over = True
+            self.history.append(move)
+            self.current_turn += 1
+            return True
         return False
-    
-    def simulate_move(self, move, player=None, board=None):
-        if player is None:
-            player = self.player_list[self.current_turn % 2]
-        if board is None:
-            board = self.board
-        
-        board_copy = board.copy()
-        for r in range(5, -1, -1):
-            if board_copy[r][move] == " ":
-                board_copy[r][move] = player
-                return board_copy
-        return board_copy
-    
-    def check_win_on_board(self, board):
-        # Check horizontal locations for win
-        for c in range(7-3):
-            for r in range(6):
-                if board[r][c] == board[r][c+1] == board[r][c+2] == board[r][c+3] and board[r][c] != " ":
-                    # print(f"Win Horizontal: Row {r}, Cols {c}-{c+3}")
-                    return board[r][c]
-
-        # Check vertical locations for win
-        for c in range(7):
-            for r in range(6-3):
-                if board[r][c] == board[r+1][c] == board[r+2][c] == board[r+3][c] and board[r][c] != " ":
-                    # print(f"Win Vertical: Col {c}, Rows {r}-{r+3}")
-                    return board[r][c]
-
-        # Check positively sloped diaganols
-        for c in range(7-3):
-            for r in range(6-3):
-                if board[r][c] == board[r+1][c+1] == board[r+2][c+2] == board[r+3][c+3] and board[r][c] != " ":
-                    # print(f"Win Pos Slope: Start ({r},{c})")
-                    return board[r][c]
-
-        # Check negatively sloped diaganols
-        for c in range(7-3):
-            for r in range(3, 6):
-                if board[r][c] == board[r-1][c+1] == board[r-2][c+2] == board[r-3][c+3] and board[r][c] != " ":
-                    # print(f"Win Neg Slope: Start ({r},{c})")
-                    return board[r][c]
-        
-        return None
+
+    def undo_move(self):
+        """Take back the last move played by make_move."""
+        move = self.history.pop()
+        self.current_turn -= 1
+        player = self.current_turn & 1
+        self.heights[move] -= 1
+        square = self.heights[move]
+        if square == move * H1 + ROWS - 1:
+            insort(self.available_moves, move)
+        self.bb[player] ^= 1 << square
+        self.zhash ^= ZOBRIST[square * 2 + player]
+        self.game_over = False
+
+    def winning_moves(self, player_bb):
+        """Return the legal columns where one more piece in 'player_bb' makes four in a row."""
+        wins = []
+        drops = ((self.bb[0] | self.bb[1]) + BOTTOM) & BOARD
+        # Visit the set bits of 'drops' lowest first, i.e. in column order.
+        while drops:
+            bit = drops & -drops
+            if _has_win(player_bb | bit):
+                wins.append((bit.bit_length() - 1) // H1)
+            drops ^= bit
+        return wins
+
+    def opp_wins_after(self, move):
+        """Return True if, after the side to move plays 'move', the opponent can win at once."""
+        opp_bb = self.bb[(self.current_turn + 1) & 1]
+        occupied = self.bb[0] | self.bb[1] | (1 << self.heights[move])
+        drops = (occupied + BOTTOM) & BOARD
+        while drops:
+            bit = drops & -drops
+            if _has_win(opp_bb | bit):
+                return True
+            drops ^= bit
+        return False
+
+    def playout(self):
+        """Finish the game with random moves (state is left untouched); return the winner, or None on a draw."""
+        result = rollout(self.bb[0], self.bb[1], np.array(self.heights, dtype=np.int64), self.current_turn)
+        return self.player_list[result] if result < 2 else None
 
     def _check_winstate(self):
-        winner = self.check_win_on_board(self.board)
-        if winner:
+        # Play stops at the first four in a row, so only the player who made the
+        # last move can have just completed one.
+        if not self.history:
+            return False
+        p = (self.current_turn - 1) & 1
+        if _has_win(self.bb[p]):
             self.game_over = True
-            return winner
+            return self.player_list[p]
         return False
-
-    
\ No newline at end of file
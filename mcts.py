@@ -1,39 +1,64 @@
 import math
+import multiprocessing
+import os
 import random
+from collections import Counter
+
+from game import COLS, seed_rollouts
+
+try:
+    import mcts_core
+except ImportError:
+    # The compiled search core is optional; see mcts_core.pyx for how to build it.
+    mcts_core = None
 
 # Monte Carlo Tree Search (MCTS) implementation for Connect4.
 # - MCTSNode: represents a node in the search tree holding game state and stats.
 # - MCTS: orchestrates selection, expansion, simulation (rollout), and backpropagation.
 # Uses UCT (Upper Confidence bound applied to Trees) for selection and
 # simple heuristics (immediate win/block checks) to prune or shortcut simulations for speed.
+# Nodes are shared between transpositions (the same position reached by different
+# move orders) through a Zobrist-keyed table, so the tree is really a DAG.
+
+# Columns set in each possible untried-moves bitmask, in ascending order.
+MASK_MOVES = [tuple(c for c in range(COLS) if mask >> c & 1) for mask in range(1 << COLS)]
 
 class MCTSNode:
     """
     Node in the MCTS tree.
 
+    Nodes do not keep a copy of their position: the search plays moves on a
+    single Connect4 instance and undoes them after each simulation.
+
     Attributes:
-    - state: a Connect4 instance representing the game state at this node.
-    - parent: parent MCTSNode (None for root).
-    - move: the move that led from the parent to this node.
-    - children: list of child nodes.
+    - children: list with one slot per column holding the child node for that
+      move, or None if not expanded. A child may have several parents when its
+      position is reachable by more than one move order.
     - wins/visits: statistics used by UCT selection.
-    - untried_moves: legal moves from this state that haven't been expanded.
+    - untried_mask: bitmask of legal moves from this state that haven't been expanded.
+    - terminal: True if the state has no legal moves (won or full board).
     - player_just_moved: the player who made the move to reach this node.
     """
-    def __init__(self, state, parent=None, move=None):
-        self.state = state  # The Connect4 game instance state
-        self.parent = parent
-        self.move = move  # The move that led to this state
-        self.children = []
+    # A search creates up to one node per simulation; slots keep them small
+    # and make attribute access a fixed-offset load.
+    __slots__ = ('children', 'wins', 'visits', '_log_visits', '_exploit',
+                 'untried_mask', 'terminal', 'player_just_moved')
+
+    def __init__(self, state):
+        self.children = [None] * COLS
         self.wins = 0
         self.visits = 0
+        # UCT terms cached by update(): ln(visits) and the win rate.
+        self._log_visits = 0.0
+        self._exploit = 0.0
         
         # If the state is terminal (win/loss) there are no untried moves.
         if state._check_winstate():
-             self.untried_moves = []
+             self.untried_mask = 0
         else:
              # Otherwise initialize with legal moves from the state.
-             self.untried_moves = self.get_legal_moves(state)
+             self.untried_mask = sum(1 << c for c in self.get_legal_moves(state))
+        self.terminal = not self.untried_mask
              
         # Player who acted last to produce this node's state.
         self.player_just_moved = state.player_list[(state.current_turn - 1) % 2]
@@ -47,23 +72,36 @@ class MCTSNode:
         Select a child node using the UCT (Upper Confidence Bound) formula.
         UCT balances exploitation (high win rate) and exploration (low visits).
         Formula: (wins / visits) + C * sqrt(ln(parent_visits) / visits), C = sqrt(2).
-        Returns the child with the highest UCT score.
+        Returns a (move, child) pair for the child with the highest UCT score.
+        Every child has been visited at least once (expansion is always followed
+        by backpropagation), so no zero-visit guard is needed.
         """
         # We moved the constant OUTSIDE the square root
-        s = sorted(self.children, key=lambda c: c.wins / c.visits + 
-                   exploration_constant * math.sqrt(math.log(self.visits) / c.visits) 
-                   if c.visits > 0 else float('inf'))
-        return s[-1]
+        lp = self._log_visits
+        sqrt = math.sqrt
+        best_move = None
+        best_score = -1.0
+        for move, c in enumerate(self.children):
+            if c is not None:
+                score = c._exploit + exploration_constant * sqrt(lp / c.visits)
+                if score > best_score:
+                    best_move, best_score = move, score
+        return best_move, self.children[best_move]
 
-    def add_child(self, move, state):
+    def add_child(self, move, state, table):
         """
-        Create a new child for this node corresponding to 'move' and return it.
+        Attach the child for 'move' to this node and return it.
         The 'state' should already reflect the move being applied.
-        Uses deepcopy to avoid shared state between nodes.
+        'table' maps Zobrist hashes to nodes; if the position is already in it the
+        existing node (and its statistics) is reused, otherwise a new node is created
+        for 'state' and registered.
         """
-        node = MCTSNode(state.copy(), parent=self, move=move)
-        self.untried_moves.remove(move)
-        self.children.append(node)
+        node = table.get(state.zhash)
+        if node is None:
+            node = MCTSNode(state)
+            table[state.zhash] = node
+        self.untried_mask &= ~(1 << move)
+        self.children[move] = node
         return node
 
     def update(self, result):
@@ -73,15 +111,28 @@ class MCTSNode:
         """
         self.visits += 1
         self.wins += result
+        self._log_visits = math.log(self.visits)
+        self._exploit = self.wins / self.visits
 
 class MCTS:
     """
     Monte Carlo Tree Search controller.
     'simulations' controls how many simulations are run when searching for the best move.
+    'native' runs the whole search in the compiled mcts_core extension instead
+    (plain tree, no transposition table, single thread).
     """
-    def __init__(self, simulations=100, exploration_constant=1.414):
+    def __init__(self, simulations=100, exploration_constant=1.414, native=False):
+        if native and mcts_core is None:
+            raise ImportError("mcts_core is not built; see mcts_core.pyx for build instructions")
         self.simulations = simulations
         self.exploration_constant = exploration_constant
+        self.native = native
+        # One RNG per searcher; choice is bound once since expansion calls it
+        # every simulation.
+        self.rng = random.Random()
+        self._rng_choice = self.rng.choice
+        # Transposition table: Zobrist hash -> MCTSNode, rebuilt for every search.
+        self.tt = {}
 
     def get_best_move(self, root_state):
         """
@@ -92,99 +143,190 @@ class MCTS:
         - Run self.simulations simulations of select -> expand -> simulate -> backpropagate
         - Return the child with the highest visit count (most explored)
         """
-        root_node = MCTSNode(state=root_state.copy())
-        
+        moves = self._root_moves(root_state)
+
         # If there are no moves, return None
-        if not root_node.untried_moves:
+        if not moves:
             return None
 
-        # If there's only one move, don't bother simulating
-        if len(root_node.untried_moves) == 1:
-            return root_node.untried_moves[0]
-        
+        # If there's only one move (or a winning one), don't bother simulating
+        if len(moves) == 1:
+            return moves[0]
+
+        counts = self.get_best_move_counts(root_state, moves)
+
+        # Return the move that was most visited (most reliable empirically)
+        return max(counts, key=counts.get)
+
+    def get_best_move_parallel(self, root_state, n_workers=None, pool=None):
+        """
+        Root-parallel version of get_best_move.
+
+        Each of 'n_workers' searches (default: one per CPU) builds its own tree
+        with the full self.simulations budget and a different random seed.
+        Nothing is shared while searching; the root visit counts are summed
+        afterwards and the most visited move is returned.
+
+        Starting worker processes is expensive (each one re-imports numpy and
+        numba under the spawn start method), so callers searching repeatedly
+        should create one multiprocessing.Pool and pass it as 'pool'. Without
+        it a temporary pool is created and torn down for this call.
+        """
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+
+        moves = self._root_moves(root_state)
+        if not moves:
+            return None
+        if len(moves) == 1:
+            return moves[0]
+
+        base_seed = self.rng.randrange(2**31 - n_workers)
+        jobs = [(self.exploration_constant, self.native, root_state, moves, self.simulations, base_seed + i)
+                for i in range(n_workers)]
+        if pool is None:
+            with multiprocessing.Pool(n_workers) as own_pool:
+                results = own_pool.map(_search_worker, jobs)
+        else:
+            results = pool.map(_search_worker, jobs)
+
+        counts = Counter()
+        for d in results:
+            counts.update(d)
+        return counts.most_common(1)[0][0]
+
+    def _root_moves(self, root_state):
+        """
+        Quick checks run before any simulation.
+
+        Returns the moves worth searching from root_state: an empty list if the
+        game is over, [move] if 'move' wins immediately, otherwise the legal moves
+        minus those that let the opponent win on the next turn (all of them are
+        kept if every move does).
+        """
+        # A finished game has nothing to search.
+        if root_state._check_winstate():
+            return []
+        legal_moves = root_state._get_available_moves()
+        if len(legal_moves) <= 1:
+            return legal_moves
+
         # ---------------------------------------------------------
         # Pre-MCTS checks to prevent immediate loss
         # ---------------------------------------------------------
         # Heuristics to speed up and avoid blunders:
         # 1) If we can win immediately, take the winning move.
         # 2) Prune moves that would allow the opponent to win immediately.
-        legal_moves = root_state._get_available_moves()
-        safe_moves = []
-        
-        ai_player = root_state.player_list[root_state.current_turn % 2]
-        human_player = root_state.player_list[(root_state.current_turn + 1) % 2]
+        # Both checks are a handful of bitboard operations per column; nothing
+        # is copied.
+        ai_index = root_state.current_turn % 2
         
         # First, check if WE can win immediately. Use that.
-        for move in legal_moves:
-            next_board = root_state.simulate_move(move)
-            if root_state.check_win_on_board(next_board) == ai_player:
-                return move # Take the win!
+        wins = root_state.winning_moves(root_state.bb[ai_index])
+        if wins:
+            return wins[:1] # Take the win!
         
         # Second, check if we MUST block.
         # A move is "unsafe" if the opponent can win immediately after.
-        for move in legal_moves:
-            # Simulate us making 'move'
-            sim_board = root_state.simulate_move(move)
-            
-            humans_legal_moves = root_state._get_available_moves(sim_board)
-            opponent_can_win = False
-            
-            for opp_move in humans_legal_moves:
-                sim2_board = root_state.simulate_move(opp_move, human_player, sim_board)
-                if root_state.check_win_on_board(sim2_board) == human_player:
-                    opponent_can_win = True
-                    break
-            
-            if not opponent_can_win:
-                safe_moves.append(move)
+        safe_moves = [move for move in legal_moves if not root_state.opp_wins_after(move)]
                 
         # If we have safe moves, prune unsafe ones (reduces branching factor).
-        if safe_moves:
-            common_safe = [m for m in root_node.untried_moves if m in safe_moves]
-            if common_safe:
-                root_node.untried_moves = common_safe
+        return safe_moves or legal_moves
+
+    def get_best_move_counts(self, root_state, root_moves=None, simulations=None):
+        """
+        Run the select -> expand -> simulate -> backpropagate loop from root_state
+        and return a dict mapping each expanded root move to its visit count.
+
+        'root_moves' restricts which moves are searched at the root (default: all
+        legal moves) and 'simulations' overrides self.simulations.
+        """
+        if simulations is None:
+            simulations = self.simulations
+
+        if self.native:
+            if root_moves is None:
+                root_moves = root_state._get_available_moves()
+            visits = mcts_core.search(root_state.bb[0], root_state.bb[1], root_state.heights,
+                                      root_state.current_turn, simulations,
+                                      self.exploration_constant,
+                                      sum(1 << m for m in root_moves), self.rng.getrandbits(64))
+            return {move: n for move, n in enumerate(visits) if n}
+
+        root_node = MCTSNode(state=root_state)
+        self.tt = {root_state.zhash: root_node}
+        if root_moves is not None:
+            root_node.untried_mask = sum(1 << m for m in root_moves)
         
-        # Main MCTS loop: repeat simulations
-        for _ in range(self.simulations):
-            node = root_node
-            # Work on a fresh copy of the root state for this simulation
-            state = root_state.copy()
-
-            # 1. Selection: Use UCT to pick the child to follow.
-            while node.untried_moves == [] and node.children != []:
-                node = node.uct_select_child(self.exploration_constant)
-                state.make_move(node.move)
-
-            # 2. Expansion : Expand one untried move.
-            if node.untried_moves != []:
-                m = random.choice(node.untried_moves)
-                state.make_move(m)
-                node = node.add_child(m, state)
-
-            # 3. Simulation (Rollout): Play random moves until the game ends.
-            while not state.game_over:
-                legal_moves = state._get_available_moves()
-                
-                if not legal_moves:
-                    break
-                
-                state.make_move(random.choice(legal_moves))
-                state._check_winstate()
-
-            # 4. Backpropagation: Propagate results up the tree.
-            winner = state._check_winstate()
-            
-            # Walk up the tree and update each node's statistics.
-            while node is not None:
-                if winner:
-                    # If the player who JUST moved at this node is the winner, count as a win
-                    if node.player_just_moved == winner:
-                        node.update(1)
-                    else:
-                        node.update(0)
+        self._run(root_node, root_state, simulations)
+
+        return {move: child.visits for move, child in enumerate(root_node.children)
+                if child is not None}
+
+    def _run(self, root_node, state, simulations):
+        """
+        Main MCTS loop: repeat simulations.
+        Every simulation plays its moves directly on 'state' and undoes them
+        afterwards, so the caller gets the position back unchanged, even if
+        the search is interrupted part-way through a simulation.
+        """
+        root_depth = len(state.history)
+        for _ in range(simulations):
+            try:
+                path = self._descend(root_node, state)
+
+                # 3. Simulation (Rollout): Play random moves until the game ends.
+                # Unless the expanded position is already won, the whole playout
+                # runs in one compiled call on the bitboards.
+                winner = state._check_winstate() or state.playout()
+
+                self._backpropagate(path, winner)
+            finally:
+                # Rewind to the root position for the next simulation.
+                while len(state.history) > root_depth:
+                    state.undo_move()
+
+    def _descend(self, root_node, state):
+        """
+        Selection and expansion for one simulation, playing the moves on 'state'.
+        Returns the list of nodes visited, starting at root_node.
+        """
+        node = root_node
+        # Nodes visited in this simulation; a node can have several parents,
+        # so backpropagation follows this path rather than parent links.
+        path = [node]
+
+        # 1. Selection: Use UCT to pick the child to follow.
+        while not node.untried_mask and not node.terminal:
+            move, node = node.uct_select_child(self.exploration_constant)
+            state.make_move(move)
+            path.append(node)
+
+        # 2. Expansion : Expand one untried move.
+        if node.untried_mask:
+            m = self._rng_choice(MASK_MOVES[node.untried_mask])
+            state.make_move(m)
+            node = node.add_child(m, state, self.tt)
+            path.append(node)
+
+        return path
+
+    def _backpropagate(self, path, winner):
+        """4. Backpropagation: walk back along the path and update each node's statistics."""
+        for node in reversed(path):
+            if winner:
+                # If the player who JUST moved at this node is the winner, count as a win
+                if node.player_just_moved == winner:
+                    node.update(1)
                 else:
-                    node.update(0.5)
-                node = node.parent
+                    node.update(0)
+            else:
+                node.update(0.5)
 
-        # Return the move that was most visited (most reliable empirically)
-        return sorted(root_node.children, key=lambda c: c.visits)[-1].move
+def _search_worker(args):
+    """Pool entry point for get_best_move_parallel: seed this process, then search."""
+    exploration_constant, native, root_state, root_moves, simulations, seed = args
+    seed_rollouts(seed)
+    ai = MCTS(simulations=simulations, exploration_constant=exploration_constant, native=native)
+    ai.rng.seed(seed)
+    return ai.get_best_move_counts(root_state, root_moves)
@@ -0,0 +1,198 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+Optional compiled MCTS search for Connect4, used by MCTS(native=True).
+
+The whole select -> expand -> simulate -> backpropagate loop runs in C on
+bitboards (same 7-bit column layout as game.py) with the GIL released.
+Unlike the Python search it keeps a plain tree: no transposition table.
+
+Build it in place with:
+
+    pip install cython
+    CFLAGS="-O3 -march=native" cythonize -i -3 mcts_core.pyx
+"""
+from libc.math cimport log, sqrt
+from libc.stdint cimport int8_t, int32_t, uint8_t, uint64_t
+from libc.stdlib cimport free, malloc
+
+cdef enum:
+    ROWS = 6
+    COLS = 7
+    H1 = ROWS + 1
+    NO_WINNER = -1
+    DRAW = 2
+
+cdef struct Board:
+    uint64_t bb[2]
+    uint8_t heights[COLS]   # bit index of the next free slot in each column
+    int turn
+
+cdef struct Node:
+    int32_t children[COLS]  # node index per column, -1 if not expanded
+    uint8_t untried         # bitmask of legal columns not expanded yet
+    int8_t mover            # player who made the move into this node
+    int8_t winner           # NO_WINNER, a player index, or DRAW if terminal
+    int32_t visits
+    double wins
+
+cdef inline bint line_of_four(uint64_t bb, int s) noexcept nogil:
+    cdef uint64_t x = bb & (bb >> s)
+    return (x & (x >> (2 * s))) != 0
+
+cdef inline bint has_win(uint64_t bb) noexcept nogil:
+    # Shifts: 1 = vertical, 7 = horizontal, 6 = negative slope, 8 = positive slope.
+    return (line_of_four(bb, 1) or line_of_four(bb, 7) or
+            line_of_four(bb, 6) or line_of_four(bb, 8))
+
+cdef inline uint8_t legal_mask(Board* b) noexcept nogil:
+    cdef uint8_t m = 0
+    cdef int c
+    for c in range(COLS):
+        if b.heights[c] < c * H1 + ROWS:
+            m |= 1 << c
+    return m
+
+cdef inline int play(Board* b, int col) noexcept nogil:
+    """Drop a piece for the side to move; return its winner state afterwards."""
+    cdef int p = b.turn & 1
+    b.bb[p] ^= (<uint64_t>1) << b.heights[col]
+    b.heights[col] += 1
+    b.turn += 1
+    if has_win(b.bb[p]):
+        return p
+    if legal_mask(b) == 0:
+        return DRAW
+    return NO_WINNER
+
+cdef inline uint64_t next_random(uint64_t* state) noexcept nogil:
+    # xorshift64*: portable and much cheaper than a libc call per ply.
+    cdef uint64_t x = state[0]
+    x ^= x >> 12
+    x ^= x << 25
+    x ^= x >> 27
+    state[0] = x
+    return x * 0x2545F4914F6CDD1DULL
+
+cdef inline int random_bit(uint8_t mask, uint64_t* rng) noexcept nogil:
+    """Return the column of a uniformly chosen set bit of 'mask' (mask != 0)."""
+    cdef int n = 0, c
+    cdef int cols[COLS]
+    for c in range(COLS):
+        if mask >> c & 1:
+            cols[n] = c
+            n += 1
+    return cols[next_random(rng) % n]
+
+cdef int rollout(Board b, uint64_t* rng) noexcept nogil:
+    """Play random moves on a copy of 'b' until the game ends; return the winner state."""
+    cdef int result
+    if legal_mask(&b) == 0:
+        return DRAW
+    while True:
+        result = play(&b, random_bit(legal_mask(&b), rng))
+        if result != NO_WINNER:
+            return result
+
+cdef inline void init_node(Node* n, Board* b, int winner) noexcept nogil:
+    cdef int c
+    for c in range(COLS):
+        n.children[c] = -1
+    n.winner = winner
+    n.untried = legal_mask(b) if winner == NO_WINNER else 0
+    n.mover = (b.turn - 1) & 1
+    n.visits = 0
+    n.wins = 0.0
+
+cdef int select_child(Node* nodes, Node* n, double c_uct) noexcept nogil:
+    """UCT: (wins / visits) + C * sqrt(ln(parent_visits) / visits); returns a column."""
+    cdef double lp = log(n.visits)
+    cdef double best = -1.0, score
+    cdef int best_col = -1, c
+    cdef Node* child
+    for c in range(COLS):
+        if n.children[c] >= 0:
+            child = &nodes[n.children[c]]
+            score = child.wins / child.visits + c_uct * sqrt(lp / child.visits)
+            if score > best:
+                best = score
+                best_col = c
+    return best_col
+
+cdef void run_search(Board* root, Node* nodes, int simulations, double c_uct,
+                     uint8_t root_mask, uint64_t* rng) noexcept nogil:
+    cdef int32_t path[ROWS * COLS + 1]
+    cdef int n_nodes = 1, depth, sim, col, winner, i
+    cdef Board b
+    cdef Node* n
+
+    init_node(&nodes[0], root, NO_WINNER)
+    nodes[0].untried &= root_mask
+
+    for sim in range(simulations):
+        b = root[0]
+        path[0] = 0
+        depth = 1
+        n = &nodes[0]
+
+        # 1. Selection and 2. expansion.
+        while n.winner == NO_WINNER:
+            if n.untried:
+                col = random_bit(n.untried, rng)
+                n.untried &= ~(1 << col)
+                winner = play(&b, col)
+                n.children[col] = n_nodes
+                init_node(&nodes[n_nodes], &b, winner)
+                path[depth] = n_nodes
+                depth += 1
+                n_nodes += 1
+                break
+            col = select_child(nodes, n, c_uct)
+            if col < 0:
+                break
+            play(&b, col)
+            path[depth] = n.children[col]
+            depth += 1
+            n = &nodes[n.children[col]]
+
+        # 3. Simulation.
+        n = &nodes[path[depth - 1]]
+        winner = n.winner if n.winner != NO_WINNER else rollout(b, rng)
+
+        # 4. Backpropagation.
+        for i in range(depth):
+            n = &nodes[path[i]]
+            n.visits += 1
+            if winner == DRAW:
+                n.wins += 0.5
+            elif winner == n.mover:
+                n.wins += 1.0
+
+def search(uint64_t bb0, uint64_t bb1, heights, int turn, int simulations,
+           double c_uct, int root_mask=0x7f, uint64_t seed=0x9E3779B97F4A7C15):
+    """
+    Run 'simulations' MCTS simulations from the given bitboard position and
+    return a list with the root visit count of each column (0 if never tried).
+    'root_mask' limits which columns are searched at the root.
+    """
+    cdef Board root
+    cdef Node* nodes
+    cdef uint64_t rng = seed | 1
+    cdef int c
+
+    root.bb[0] = bb0
+    root.bb[1] = bb1
+    for c in range(COLS):
+        root.heights[c] = heights[c]
+    root.turn = turn
+
+    # At most one node is added per simulation, plus the root.
+    nodes = <Node*>malloc((simulations + 1) * sizeof(Node))
+    if nodes == NULL:
+        raise MemoryError()
+    try:
+        with nogil:
+            run_search(&root, nodes, simulations, c_uct, <uint8_t>root_mask, &rng)
+        return [nodes[nodes[0].children[c]].visits if nodes[0].children[c] >= 0 else 0
+                for c in range(COLS)]
+    finally:
+        free(nodes)
@@ -0,0 +1,99 @@
+"""
+Regression checks for the Connect4 bitboard bookkeeping.
+
+Plays random games and compares the incremental state (bitboards, heights,
+Zobrist hash, available_moves, undo) and the bitboard win queries against
+brute-force versions built on the display board. Run with
+`python test_game.py` (or pytest).
+"""
+import random
+
+from game import COLS, H1, ROWS, ZOBRIST, Connect4
+
+GAMES = 100
+
+
+# Every four-in-a-row line on the board, as (row, col) cells of the display board.
+LINES = [[(r + i * dr, c + i * dc) for i in range(4)]
+         for r in range(ROWS) for c in range(COLS)
+         for dr, dc in ((0, 1), (1, 0), (1, 1), (-1, 1))
+         if 0 <= r + 3 * dr < ROWS and 0 <= c + 3 * dc < COLS]
+
+
+def brute_winners(board):
+    """Return the set of players ("R"/"Y") with four in a row on the display board."""
+    winners = set()
+    for line in LINES:
+        marks = {board[r][c] for r, c in line}
+        if len(marks) == 1 and " " not in marks:
+            winners |= marks
+    return winners
+
+
+def brute_hash(g):
+    """Zobrist hash recomputed from scratch."""
+    h = 0
+    for p, bb in enumerate(g.bb):
+        for square in range(COLS * H1):
+            if bb >> square & 1:
+                h ^= ZOBRIST[square * 2 + p]
+    return h
+
+
+def snapshot(g):
+    return (list(g.bb), list(g.heights), g.zhash, list(g.available_moves),
+            list(g.history), g.current_turn)
+
+
+def random_positions(seed):
+    """Yield every non-terminal position of GAMES random games."""
+    rng = random.Random(seed)
+    for _ in range(GAMES):
+        g = Connect4()
+        while g.available_moves and not g._check_winstate():
+            yield g
+            g.make_move(rng.choice(g.available_moves))
+
+
+def test_make_undo_roundtrip():
+    rng = random.Random(1)
+    for g in random_positions(1):
+        before = snapshot(g)
+        assert g.zhash == brute_hash(g)
+        assert g.available_moves == [c for c in range(COLS) if g.heights[c] < c * H1 + ROWS]
+        move = rng.choice(g.available_moves)
+        g.make_move(move)
+        g.undo_move()
+        assert snapshot(g) == before
+
+
+def test_win_queries_match_brute_force():
+    for g in random_positions(2):
+        me = g.player_list[g.current_turn % 2]
+        opp = g.player_list[(g.current_turn + 1) % 2]
+
+        expected_wins = []
+        for move in g.available_moves:
+            after = g.copy()
+            after.make_move(move)
+            if me in brute_winners(after.board):
+                expected_wins.append(move)
+        assert g.winning_moves(g.bb[g.current_turn % 2]) == expected_wins
+
+        for move in g.available_moves:
+            after = g.copy()
+            after.make_move(move)
+            opp_can_win = False
+            for reply in after.available_moves:
+                after2 = after.copy()
+                after2.make_move(reply)
+                if opp in brute_winners(after2.board):
+                    opp_can_win = True
+                    break
+            assert g.opp_wins_after(move) == opp_can_win
+
+
+if __name__ == "__main__":
+    test_make_undo_roundtrip()
+    test_win_queries_match_brute_force()
+    print("ok")